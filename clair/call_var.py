@@ -1,23 +1,29 @@
 import sys
 import os
+import re
 import logging
 import numpy as np
 import deepdish as dd
 import pysam
 from time import time
 from argparse import ArgumentParser
-from threading import Thread
-from math import log, e
+from threading import Thread, Lock, local
+from concurrent.futures import ThreadPoolExecutor
+from queue import Queue
+from math import log
 from enum import IntEnum
-from collections import namedtuple, defaultdict
+from collections import namedtuple, Counter
+from functools import lru_cache
 
 
 import clair.utils as utils
 from clair.model import Clair
 from clair.task.gt21 import (
-    GT21_Type, gt21_enum_from_label, gt21_enum_from,
-    HOMO_SNP_GT21, HOMO_SNP_LABELS,
-    HETERO_SNP_GT21, HETERO_SNP_LABELS
+    GT21_Type, gt21_enum_from,
+    HOMO_SNP_GT21, HOMO_SNP_BASE_TUPLES,
+    HETERO_SNP_GT21, HETERO_SNP_BASE_TUPLES,
+    HETERO_INS_GT21, HETERO_DEL_GT21,
+    HOMO_REFERENCE_GT21
 )
 from clair.task.genotype import Genotype, genotype_string_from, genotype_enum_from, genotype_enum_for_task
 from clair.task.variant_length import VariantLength
@@ -31,6 +37,36 @@ minimum_variant_length_that_need_infer = VariantLength.max
 maximum_variant_length_that_need_infer = 50
 inferred_indel_length_minimum_allele_frequency = 0.125
 flanking_base_number = param.flankingBaseNum
+HOMO_SNP_GT21_INDICES = np.array(HOMO_SNP_GT21, dtype=np.intp)
+HETERO_SNP_GT21_INDICES = np.array(HETERO_SNP_GT21, dtype=np.intp)
+HETERO_INS_GT21_INDICES = np.array(HETERO_INS_GT21, dtype=np.intp)
+HETERO_DEL_GT21_INDICES = np.array(HETERO_DEL_GT21, dtype=np.intp)
+# bytes.translate() tables for encoding the reference bases of a whole batch,
+# homo reference gt21 (non ACGT bases are treated as A) and whether it is one of the BASIC_BASES
+HOMO_REFERENCE_GT21_TRANSLATION_TABLE = bytes(
+    HOMO_REFERENCE_GT21[BASE2ACGT.get(chr(code), "A")] for code in range(256)
+)
+BASIC_BASE_TRANSLATION_TABLE = bytes(int(chr(code) in BASIC_BASES) for code in range(256))
+# plain int / str copies of enum based values used for every candidate, cheaper than enum attribute lookups
+GENOTYPE_HOMO_REFERENCE = int(Genotype.homo_reference)
+GENOTYPE_HOMO_VARIANT = int(Genotype.homo_variant)
+GENOTYPE_HETERO_VARIANT = int(Genotype.hetero_variant)
+VARIANT_LENGTH_0_INDEX = 0 + VariantLength.index_offset
+HOMO_REFERENCE_GENOTYPE_STRING = genotype_string_from(Genotype.homo_reference)
+HOMO_VARIANT_GENOTYPE_STRING = genotype_string_from(Genotype.homo_variant)
+HETERO_VARIANT_GENOTYPE_STRING = genotype_string_from(Genotype.hetero_variant)
+HETERO_VARIANT_MULTI_GENOTYPE_STRING = genotype_string_from(Genotype.hetero_variant_multi)
+# -10 * log10(x) == PHRED_SCALE * ln(x)
+PHRED_SCALE = -10 / log(10)
+OUTPUT_BUFFER_SIZE = 1024 * 1024
+PILEUP_KWARGS = dict(
+    flag_filter=param.SAMTOOLS_VIEW_FILTER_FLAG,
+    min_base_quality=0,
+    max_depth=250,
+)
+# pileup query sequence with indel, e.g. A+2AC / A-2NN
+INSERTION_SEQUENCE_PATTERN = re.compile(r".\+(\d+)")
+DELETION_SEQUENCE_PATTERN = re.compile(r".-(\d+)")
 
 OutputConfig = namedtuple('OutputConfig', [
     'is_show_reference',
@@ -46,6 +82,7 @@ OutputUtilities = namedtuple('OutputUtilities', [
     'deletion_bases_using',
     'insertion_bases_using_pysam_using',
     'output',
+    'output_in_parallel',
     'output_header',
     'close_opened_files',
 ])
@@ -58,14 +95,19 @@ class Channel(IntEnum):
     SNP = 3
 
 
+def argmax_from(values):
+    """
+    Return index of the first maximum value, cheaper than np.argmax for a handful of values
+    """
+    return max(range(len(values)), key=values.__getitem__)
+
+
 def homo_SNP_bases_from(gt21_probabilities):
-    output_bases = HOMO_SNP_LABELS[np.argmax([gt21_probabilities[gt21_enum] for gt21_enum in HOMO_SNP_GT21])]
-    return output_bases[0], output_bases[1]
+    return HOMO_SNP_BASE_TUPLES[argmax_from([gt21_probabilities[gt21_enum] for gt21_enum in HOMO_SNP_GT21])]
 
 
 def hetero_SNP_bases_from(gt21_probabilities):
-    output_bases = HETERO_SNP_LABELS[np.argmax([gt21_probabilities[gt21_enum] for gt21_enum in HETERO_SNP_GT21])]
-    return output_bases[0], output_bases[1]
+    return HETERO_SNP_BASE_TUPLES[argmax_from([gt21_probabilities[gt21_enum] for gt21_enum in HETERO_SNP_GT21])]
 
 
 def filtration_value_from(quality_score_for_pass, quality_score):
@@ -84,56 +126,80 @@ def pileup(sam_file, contig, position_start, position_end, func):
     contig: chromosome name or contig name
     position_start: start position. 0-based. Inclusive.
     position_end: ending position. 0-based. Exclusive.
-    func: callback for pileup_column
+    func: callback for pileup_column, the pileup stops once it returns True
     """
     try:
-        for pileup_column in sam_file.pileup(
-            contig,
-            start=position_start,
-            stop=position_end,
-            flag_filter=param.SAMTOOLS_VIEW_FILTER_FLAG,
-            min_base_quality=0,
-            max_depth=250
-        ):
-            func(pileup_column)
+        for pileup_column in sam_file.pileup(contig, start=position_start, stop=position_end, **PILEUP_KWARGS):
+            if func(pileup_column):
+                break
     except AssertionError:
         pass
 
 
-def insertion_bases_using_pysam_from(
-    sam_file,
-    contig,
-    position,
-    minimum_insertion_length=1,
-    maximum_insertion_length=maximum_variant_length_that_need_infer,
-    insertion_bases_to_ignore=""
-):
-    insertion_bases_dict = defaultdict(lambda: 0)
+# indel alleles of the last pileup column of each thread,
+# retried indel outcomes and the second allele of a candidate query the same position again.
+# columns are not piled up for a whole window of candidates at once: with max_depth, the reads kept
+# in a column depend on where the pileup starts, so a wider pileup could change the called indel bases
+pileup_column_cache = local()
+
+
+def indel_alleles_from(sam_file, contig, position):
+    """
+    Return (insertions, deletion_lengths) of reads in the pileup column before the position, in read order
+        insertions: list of (insertion length, upper case insertion bases)
+        deletion_lengths: list of deletion length
+    """
+    if (
+        getattr(pileup_column_cache, "sam_file", None) is sam_file and
+        pileup_column_cache.contig == contig and pileup_column_cache.position == position
+    ):
+        return pileup_column_cache.indel_alleles
+
+    insertions, deletion_lengths = [], []
 
     def lambda_function(pileup_column):
+        # columns come in position order, stop the pileup once past the column before the position
         if pileup_column.reference_pos != position - 1:
-            return
+            return pileup_column.reference_pos > position - 1
 
         for sequence in pileup_column.get_query_sequences(mark_matches=False, mark_ends=False, add_indels=True):
-            # minimum sequence needed: A+1A, and "+" for insertion
-            if len(sequence) < 4 or sequence[1] != "+":
+            # minimum sequence needed: A+1A / A-1A
+            if len(sequence) < 4:
                 continue
+            insertion_match = INSERTION_SEQUENCE_PATTERN.match(sequence)
+            if insertion_match is not None:
+                insertions.append((int(insertion_match.group(1)), sequence[insertion_match.end():].upper()))
+                continue
+            deletion_match = DELETION_SEQUENCE_PATTERN.match(sequence)
+            if deletion_match is not None:
+                deletion_lengths.append(int(deletion_match.group(1)))
+        return True
+    pileup(sam_file, contig, position, position + 1, func=lambda_function)
 
-            no_of_insertion_bases = 0
-            for (string_index, c) in enumerate(sequence[2:]):
-                if not c.isdigit():
-                    insertion_bases = sequence[string_index+2:].upper()
-                    break
-                no_of_insertion_bases = no_of_insertion_bases * 10 + int(c)
+    pileup_column_cache.sam_file = sam_file
+    pileup_column_cache.contig = contig
+    pileup_column_cache.position = position
+    pileup_column_cache.indel_alleles = (insertions, deletion_lengths)
+    return pileup_column_cache.indel_alleles
 
-            if (
-                minimum_insertion_length <= no_of_insertion_bases <= maximum_insertion_length and
-                insertion_bases != insertion_bases_to_ignore
-            ):
-                insertion_bases_dict[insertion_bases] = insertion_bases_dict[insertion_bases] + 1
-    pileup(sam_file, contig, position, position+1, func=lambda_function)
 
-    return max(insertion_bases_dict, key=insertion_bases_dict.get) if len(insertion_bases_dict) > 0 else ""
+def insertion_bases_using_pysam_from(
+    sam_file,
+    contig,
+    position,
+    minimum_insertion_length=1,
+    maximum_insertion_length=maximum_variant_length_that_need_infer,
+    insertion_bases_to_ignore=""
+):
+    insertions, _ = indel_alleles_from(sam_file, contig, position)
+    insertion_bases_counter = Counter(
+        insertion_bases for no_of_insertion_bases, insertion_bases in insertions
+        if (
+            minimum_insertion_length <= no_of_insertion_bases <= maximum_insertion_length and
+            insertion_bases != insertion_bases_to_ignore
+        )
+    )
+    return insertion_bases_counter.most_common(1)[0][0] if len(insertion_bases_counter) > 0 else ""
 
 
 def deletion_bases_using_pysam_from(
@@ -144,31 +210,21 @@ def deletion_bases_using_pysam_from(
     minimum_deletion_length=1,
     maximum_deletion_length=maximum_variant_length_that_need_infer
 ):
-    deletion_bases_dict = defaultdict(lambda: 0)
-
-    def lambda_function(pileup_column):
-        if pileup_column.reference_pos != position - 1:
-            return
-
-        for sequence in pileup_column.get_query_sequences(mark_matches=False, mark_ends=False, add_indels=True):
-            # minimum sequence needed: A-1A, and "-" for deletion
-            if len(sequence) < 4 or sequence[1] != "-":
-                continue
+    _, deletion_lengths = indel_alleles_from(sam_file, contig, position)
+    deletion_bases_counter = Counter()
+    # reference bases fetched for each deletion length, reads of the same length share the fetch
+    deletion_bases_of_length = {}
 
-            no_of_deletion_bases = 0
-            for c in sequence[2:]:
-                if not c.isdigit():
-                    deletion_bases = fasta_file.fetch(
-                        reference=contig, start=position, end=position + no_of_deletion_bases
-                    )
-                    break
-                no_of_deletion_bases = no_of_deletion_bases * 10 + int(c)
-
-            if minimum_deletion_length <= no_of_deletion_bases <= maximum_deletion_length:
-                deletion_bases_dict[deletion_bases] = deletion_bases_dict[deletion_bases] + 1
-    pileup(sam_file, contig, position, position+1, func=lambda_function)
+    for no_of_deletion_bases in deletion_lengths:
+        if not minimum_deletion_length <= no_of_deletion_bases <= maximum_deletion_length:
+            continue
+        deletion_bases = deletion_bases_of_length.get(no_of_deletion_bases)
+        if deletion_bases is None:
+            deletion_bases = fasta_file.fetch(reference=contig, start=position, end=position + no_of_deletion_bases)
+            deletion_bases_of_length[no_of_deletion_bases] = deletion_bases
+        deletion_bases_counter[deletion_bases] += 1
 
-    return max(deletion_bases_dict, key=deletion_bases_dict.get) if len(deletion_bases_dict) > 0 else ""
+    return deletion_bases_counter.most_common(1)[0][0] if len(deletion_bases_counter) > 0 else ""
 
 
 def Run(args):
@@ -177,10 +233,9 @@ def Run(args):
     os.environ["OMP_NUM_THREADS"] = "1"
     os.environ["OPENBLAS_NUM_THREADS"] = "1"
     os.environ["MKL_NUM_THREADS"] = "1"
-    os.environ["MKL_NUM_THREADS"] = "1"
     os.environ["NUMEXPR_NUM_THREADS"] = "1"
 
-    if args.threads == None:
+    if args.threads is None:
         if args.tensor_fn == "PIPE":
             param.NUM_THREADS = 4
     else:
@@ -205,6 +260,9 @@ def Run(args):
         reference_file_path=args.ref_fn,
         bam_file_path=args.bam_fn,
         output_file_path=args.call_fn,
+        # output workers only when asked for with --threads, each of them opens its own BAM and reference files
+        num_threads=param.NUM_THREADS if args.threads is not None else 1,
+        num_decompression_threads=max(2, param.NUM_THREADS // 2),
     )
 
     if args.input_probabilities:
@@ -229,13 +287,62 @@ def output_utilties_from(
     bam_file_path,
     reference_file_path,
     output_file_path,
+    num_threads=1,
+    num_decompression_threads=1,
 ):
     fasta_file = pysam.FastaFile(filename=reference_file_path) if reference_file_path else None
-    sam_file = pysam.AlignmentFile(bam_file_path, mode="rb")
-    output_file = open(output_file_path, "w")
+    # htslib thread pool for BAM decompression, which bounds pileup() on deep-coverage sites,
+    # only when this file does the decoding, i.e. no worker pool with files of its own is created
+    sam_file = pysam.AlignmentFile(
+        bam_file_path, mode="rb", threads=num_decompression_threads if num_threads <= 1 else 1
+    )
+    output_file = open(output_file_path, "w", buffering=OUTPUT_BUFFER_SIZE)
+
+    # pysam file handles are not thread-safe, each worker thread opens its own pair
+    thread_local_storage = local()
+    worker_opened_files = []
+    worker_opened_files_lock = Lock()
+
+    def open_files_for_worker():
+        thread_local_storage.sam_file = pysam.AlignmentFile(bam_file_path, mode="rb")
+        thread_local_storage.fasta_file = (
+            pysam.FastaFile(filename=reference_file_path) if reference_file_path else None
+        )
+        with worker_opened_files_lock:
+            worker_opened_files.append((thread_local_storage.sam_file, thread_local_storage.fasta_file))
+
+    thread_pool = ThreadPoolExecutor(
+        max_workers=num_threads, initializer=open_files_for_worker
+    ) if num_threads > 1 else None
 
     def output(string_value):
-        print(string_value, file=output_file)
+        output_lines = getattr(thread_local_storage, "output_lines", None)
+        if output_lines is not None:
+            output_lines.append(string_value)
+            return
+        output_file.write(string_value + "\n")
+
+    def output_in_parallel(func, tasks):
+        """
+        Run func on every task with the thread pool, output of each task is written in the order of tasks.
+        Outputs are collected in memory and written with one write() call per batch.
+        """
+        def buffered_output_from(task):
+            thread_local_storage.output_lines = []
+            try:
+                func(task)
+                return thread_local_storage.output_lines
+            finally:
+                thread_local_storage.output_lines = None
+
+        if thread_pool is None:
+            output_lines_of_tasks = [buffered_output_from(task) for task in tasks]
+        else:
+            output_lines_of_tasks = thread_pool.map(buffered_output_from, tasks)
+
+        output_lines = [string_value for output_lines in output_lines_of_tasks for string_value in output_lines]
+        if len(output_lines) > 0:
+            output_file.write("\n".join(output_lines) + "\n")
 
     def print_debug_message(
         chromosome,
@@ -246,9 +353,6 @@ def output_utilties_from(
         variant_length_probabilities_2,
         extra_infomation_string=""
     ):
-        if not is_debug:
-            return
-
         output("{}\t{}\t{}\t{}\t{}\t{}\t{}".format(
             chromosome,
             position,
@@ -259,26 +363,33 @@ def output_utilties_from(
             extra_infomation_string
         ))
 
+    def skip_debug_message(*args):
+        return
+
+    # choose the indel bases helpers once instead of checking the option for every row
+    if is_using_pysam_for_all_indel_bases_output:
+        insertion_bases_function, deletion_bases_function = insertion_bases_from_pysam, deletion_bases_from_pysam
+    else:
+        insertion_bases_function, deletion_bases_function = insertion_bases_from, deletion_bases_from
+
     def insertion_bases_using(tensor_input, variant_length, contig, position):
-        return insertion_bases_from(
-            sam_file=sam_file,
+        return insertion_bases_function(
+            sam_file=getattr(thread_local_storage, "sam_file", sam_file),
             tensor_input=tensor_input,
             variant_length=variant_length,
             contig=contig,
             position=position,
-            is_using_pysam_for_all_indel_bases_output=is_using_pysam_for_all_indel_bases_output
         )
 
     def deletion_bases_using(tensor_input, variant_length, contig, position, reference_sequence):
-        return deletion_bases_from(
+        return deletion_bases_function(
             tensor_input=tensor_input,
             variant_length=variant_length,
-            sam_file=sam_file,
-            fasta_file=fasta_file,
+            sam_file=getattr(thread_local_storage, "sam_file", sam_file),
+            fasta_file=getattr(thread_local_storage, "fasta_file", fasta_file),
             contig=contig,
             position=position,
             reference_sequence=reference_sequence,
-            is_using_pysam_for_all_indel_bases_output=is_using_pysam_for_all_indel_bases_output
         )
 
     def insertion_bases_using_pysam_using(
@@ -289,7 +400,7 @@ def output_utilties_from(
         insertion_bases_to_ignore
     ):
         return insertion_bases_using_pysam_from(
-            sam_file=sam_file,
+            sam_file=getattr(thread_local_storage, "sam_file", sam_file),
             contig=contig,
             position=position,
             minimum_insertion_length=minimum_insertion_length,
@@ -298,6 +409,12 @@ def output_utilties_from(
         )
 
     def close_opened_files():
+        if thread_pool is not None:
+            thread_pool.shutdown()
+        for worker_sam_file, worker_fasta_file in worker_opened_files:
+            worker_sam_file.close()
+            if worker_fasta_file is not None:
+                worker_fasta_file.close()
         sam_file.close()
         fasta_file.close()
         output_file.close()
@@ -307,7 +424,7 @@ def output_utilties_from(
             return
 
         from textwrap import dedent
-        output(dedent("""\
+        header_lines = [dedent("""\
             ##fileformat=VCFv4.1
             ##FILTER=<ID=PASS,Description="All filters passed">
             ##FILTER=<ID=LowQual,Description="Confidence in this variant being real is below calling threshold.">
@@ -319,7 +436,7 @@ def output_utilties_from(
             ##FORMAT=<ID=GQ,Number=1,Type=Integer,Description="Genotype Quality">
             ##FORMAT=<ID=DP,Number=1,Type=Integer,Description="Read Depth">
             ##FORMAT=<ID=AF,Number=1,Type=Float,Description="Estimated allele frequency in the range (0,1)">"""
-        ))
+        )]
 
         if reference_file_path is not None:
             reference_index_file_path = reference_file_path + ".fai"
@@ -327,155 +444,160 @@ def output_utilties_from(
                 for row in fai_fp:
                     columns = row.strip().split("\t")
                     contig_name, contig_size = columns[0], columns[1]
-                    output("##contig=<ID=%s,length=%s>" % (contig_name, contig_size))
+                    header_lines.append("##contig=<ID=%s,length=%s>" % (contig_name, contig_size))
 
-        output('#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\t%s' % (sample_name))
+        header_lines.append('#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\t%s' % (sample_name))
+        output("\n".join(header_lines))
 
     return OutputUtilities(
-        print_debug_message,
+        print_debug_message if is_debug else skip_debug_message,
         insertion_bases_using,
         deletion_bases_using,
         insertion_bases_using_pysam_using,
         output,
+        output_in_parallel,
         output_header,
         close_opened_files,
     )
 
 
-def homo_Ins_tuples_from(variant_length_probabilities_1, variant_length_probabilities_2, extra_probability):
-    return [(
-        i,
-        variant_length_probabilities_1[i + VariantLength.index_offset] *
-        variant_length_probabilities_2[i + VariantLength.index_offset] * extra_probability
-    ) for i in range(1, VariantLength.max + 1)]
+VARIANT_LENGTHS = list(range(1, VariantLength.max + 1))
+HETERO_ACGT_INDEL_BASES = [base for _ in VARIANT_LENGTHS for base in "ACGT"]
+HETERO_ACGT_INDEL_LENGTHS = [length for length in VARIANT_LENGTHS for _ in "ACGT"]
+# note: one kind of InsIns is same # of insertion bases but different kind of ACGT
+HETERO_InsIns_LENGTH_TUPLES = [
+    (i, j) if i <= j else (j, i) for i in VARIANT_LENGTHS for j in VARIANT_LENGTHS
+]
+HETERO_DelDel_LENGTH_TUPLES = [
+    (i, j) if i < j else (j, i) for i in VARIANT_LENGTHS for j in VARIANT_LENGTHS if i != j
+]
+HETERO_DelDel_MASK = ~np.eye(VariantLength.max, dtype=bool)
+HETERO_InsDel_LENGTH_TUPLES = [
+    length_tuple for i in VARIANT_LENGTHS for j in VARIANT_LENGTHS for length_tuple in ((j, i), (i, j))
+]
+
+
+# insertion length 1 to VariantLength.max, then deletion length 1 to VariantLength.max
+INDEL_LENGTH_INDICES = np.array(
+    [VariantLength.index_offset + i for i in VARIANT_LENGTHS] +
+    [VariantLength.index_offset - i for i in VARIANT_LENGTHS]
+)
+INS = slice(0, VariantLength.max)
+DEL = slice(VariantLength.max, 2 * VariantLength.max)
 
 
-def hetero_Ins_tuples_from(variant_length_probabilities_1, variant_length_probabilities_2):
-    return [(
-        i,
-        max(
-            variant_length_probabilities_1[0 + VariantLength.index_offset] *
-            variant_length_probabilities_2[i + VariantLength.index_offset],
-            variant_length_probabilities_1[i + VariantLength.index_offset] *
-            variant_length_probabilities_2[0 + VariantLength.index_offset],
-        )
-    ) for i in range(1, VariantLength.max + 1)]
-
-
-def hetero_InsIns_tuples_from(variant_length_probabilities_1, variant_length_probabilities_2, extra_probability):
-    probabilities = []
-    for i in range(1, VariantLength.max + 1):
-        for j in range(1, VariantLength.max + 1):
-            # note: one kind of InsIns is same # of insertion bases but different kind of ACGT
-            probabilities.append((
-                (i, j) if i <= j else (j, i),
-                variant_length_probabilities_1[i + VariantLength.index_offset] *
-                variant_length_probabilities_2[j + VariantLength.index_offset] * extra_probability
-            ))
-    return probabilities
-
-
-def homo_Del_tuples_from(variant_length_probabilities_1, variant_length_probabilities_2, extra_probability):
-    return [(
-        i,
-        variant_length_probabilities_1[-i + VariantLength.index_offset] *
-        variant_length_probabilities_2[-i + VariantLength.index_offset] * extra_probability
-    ) for i in range(1, VariantLength.max + 1)]
-
-
-def hetero_Del_tuples_from(variant_length_probabilities_1, variant_length_probabilities_2):
-    return [(
-        i,
-        max(
-            variant_length_probabilities_1[0 + VariantLength.index_offset] *
-            variant_length_probabilities_2[-i + VariantLength.index_offset],
-            variant_length_probabilities_1[-i + VariantLength.index_offset] *
-            variant_length_probabilities_2[0 + VariantLength.index_offset],
-        )
-    ) for i in range(1, VariantLength.max + 1)]
+def indel_length_probabilities_from(variant_length_probabilities):
+    """
+    Return probabilities of insertion length 1 to max, followed by deletion length 1 to max (last axis)
+    """
+    return np.take(variant_length_probabilities, INDEL_LENGTH_INDICES, axis=-1)
 
 
-def hetero_DelDel_tuples_from(variant_length_probabilities_1, variant_length_probabilities_2, extra_probability):
-    probabilities = []
-    for i in range(1, VariantLength.max + 1):
-        for j in range(1, VariantLength.max + 1):
-            if i == j:
-                continue
-            probabilities.append((
-                (i, j) if i < j else (j, i),
-                variant_length_probabilities_1[-i + VariantLength.index_offset] *
-                variant_length_probabilities_2[-j + VariantLength.index_offset] * extra_probability
-            ))
-    return probabilities
-
-
-def hetero_InsDel_tuples_from(variant_length_probabilities_1, variant_length_probabilities_2, extra_probability):
-    probabilities = []
-    for i in range(1, VariantLength.max + 1):
-        for j in range(1, VariantLength.max + 1):
-            probabilities.append((
-                (j, i),
-                variant_length_probabilities_1[i + VariantLength.index_offset] *
-                variant_length_probabilities_2[-j + VariantLength.index_offset] * extra_probability
-            ))
-            probabilities.append((
-                (i, j),
-                variant_length_probabilities_1[-i + VariantLength.index_offset] *
-                variant_length_probabilities_2[j + VariantLength.index_offset] * extra_probability
-            ))
-    return probabilities
+def indel_length_probability_table_from(indel_length_probabilities_1, indel_length_probabilities_2):
+    """
+    Return the products of every (variant length 1, variant length 2) pair in one table,
+    both axes laid out as indel_length_probabilities_from(), i.e. [INS, INS] / [DEL, DEL] / [INS, DEL] / [DEL, INS]
+    """
+    return indel_length_probabilities_1[..., :, None] * indel_length_probabilities_2[..., None, :]
 
 
-def inferred_insertion_bases_from(tensor_input):
-    insertion_bases = ""
-    for position in range(flanking_base_number + 1, 2 * flanking_base_number + 1):
-        reference_tensor = tensor_input[position, :, Channel.reference]
-        insertion_tensor = np.copy(tensor_input[position, :, Channel.insert])
-        for base_index in range(0, 4):
-            insertion_tensor[base_index] = insertion_tensor[base_index] + insertion_tensor[base_index + 4]
-            insertion_tensor[base_index + 4] = 0
-            insertion_tensor[base_index] -= (
-                tensor_input[position, base_index, Channel.SNP] + tensor_input[position, base_index + 4, Channel.SNP]
-            )
+def hetero_indel_probabilities_from(
+    variant_length_probabilities_1,
+    variant_length_probabilities_2,
+    indel_length_probabilities_1,
+    indel_length_probabilities_2,
+):
+    return np.maximum(
+        variant_length_probabilities_1[..., 0 + VariantLength.index_offset, None] * indel_length_probabilities_2,
+        indel_length_probabilities_1 * variant_length_probabilities_2[..., 0 + VariantLength.index_offset, None],
+    )
 
-        if (
-            position < (flanking_base_number + minimum_variant_length_that_need_infer) or
-            sum(insertion_tensor) >= inferred_indel_length_minimum_allele_frequency * sum(reference_tensor)
-        ):
-            insertion_bases += num2base[np.argmax(insertion_tensor) % 4]
-        else:
-            break
-    return insertion_bases
+
+def homo_Ins_tuples_from(length_probability_table, extra_probability):
+    return list(VARIANT_LENGTHS), (length_probability_table[INS, INS].diagonal() * extra_probability).tolist()
+
+
+def hetero_InsIns_tuples_from(length_probability_table, extra_probability):
+    probabilities = length_probability_table[INS, INS] * extra_probability
+    return list(HETERO_InsIns_LENGTH_TUPLES), probabilities.ravel().tolist()
+
+
+def homo_Del_tuples_from(length_probability_table, extra_probability):
+    return list(VARIANT_LENGTHS), (length_probability_table[DEL, DEL].diagonal() * extra_probability).tolist()
+
+
+def hetero_DelDel_tuples_from(length_probability_table, extra_probability):
+    probabilities = length_probability_table[DEL, DEL][HETERO_DelDel_MASK] * extra_probability
+    return list(HETERO_DelDel_LENGTH_TUPLES), probabilities.tolist()
+
+
+def hetero_InsDel_tuples_from(length_probability_table, extra_probability):
+    probabilities = np.stack((
+        length_probability_table[INS, DEL],
+        length_probability_table[DEL, INS],
+    ), axis=-1) * extra_probability
+    return list(HETERO_InsDel_LENGTH_TUPLES), probabilities.ravel().tolist()
+
+
+def hetero_ACGT_indel_tuples_from(hetero_indel_probabilities, gt21_probabilities, gt21_indices, extra_probability):
+    probabilities = np.outer(hetero_indel_probabilities, np.take(gt21_probabilities, gt21_indices)) * extra_probability
+    return list(HETERO_ACGT_INDEL_BASES), list(HETERO_ACGT_INDEL_LENGTHS), probabilities.ravel().tolist()
+
+
+def insertion_base_tensor_from(tensor_input, position_start, position_end):
+    """
+    Return insertion read counts of ACGT (both strands combined, SNP reads deducted) for each position,
+    shape: (position_end - position_start, 4)
+    """
+    insertion_tensor = tensor_input[position_start:position_end, :, Channel.insert]
+    SNP_tensor = tensor_input[position_start:position_end, :, Channel.SNP]
+    insertion_base_tensor = insertion_tensor[:, :4] + insertion_tensor[:, 4:8]
+    insertion_base_tensor -= SNP_tensor[:, :4]
+    insertion_base_tensor -= SNP_tensor[:, 4:8]
+    return insertion_base_tensor
+
+
+def insertion_bases_from_insertion_base_tensor(insertion_base_tensor):
+    base_indices = np.argmax(insertion_base_tensor, axis=1)
+    # output "A" when all counts are negative, same as argmax over the zero-padded 8 channels
+    base_indices[np.max(insertion_base_tensor, axis=1) < 0] = 0
+    return "".join([num2base[base_index] for base_index in base_indices.tolist()])
+
+
+def inferred_length_from(indel_read_counts, reference_read_counts):
+    """
+    Return the number of leading positions that are treated as part of the indel
+    """
+    positions = np.arange(flanking_base_number + 1, flanking_base_number + 1 + len(indel_read_counts))
+    is_inferred = (
+        (positions < flanking_base_number + minimum_variant_length_that_need_infer) |
+        (indel_read_counts >= inferred_indel_length_minimum_allele_frequency * reference_read_counts.astype(np.float32))
+    )
+    return len(is_inferred) if np.all(is_inferred) else int(np.argmin(is_inferred))
+
+
+def inferred_insertion_bases_from(tensor_input):
+    position_start, position_end = flanking_base_number + 1, 2 * flanking_base_number + 1
+    insertion_base_tensor = insertion_base_tensor_from(tensor_input, position_start, position_end)
+    insertion_length = inferred_length_from(
+        np.sum(insertion_base_tensor, axis=1),
+        np.sum(tensor_input[position_start:position_end, :, Channel.reference], axis=1)
+    )
+    return insertion_bases_from_insertion_base_tensor(insertion_base_tensor[:insertion_length])
 
 
 def inferred_deletion_length_from(tensor_input):
-    deletion_length = 0
-    for position in range(flanking_base_number + 1, 2 * flanking_base_number + 1):
-        reference_tensor = tensor_input[position, :, Channel.reference]
-        deletion_tensor = tensor_input[position, :, Channel.delete]
-        if (
-            position < (flanking_base_number + minimum_variant_length_that_need_infer) or
-            sum(deletion_tensor) >= inferred_indel_length_minimum_allele_frequency * sum(reference_tensor)
-        ):
-            deletion_length += 1
-        else:
-            break
-    return deletion_length
+    position_start, position_end = flanking_base_number + 1, 2 * flanking_base_number + 1
+    return inferred_length_from(
+        np.sum(tensor_input[position_start:position_end, :, Channel.delete], axis=1),
+        np.sum(tensor_input[position_start:position_end, :, Channel.reference], axis=1)
+    )
 
 
 def insertion_bases_using_tensor(tensor_input, variant_length):
-    insertion_bases = ""
-    for position in range(flanking_base_number + 1, flanking_base_number + variant_length + 1):
-        insertion_tensor = np.copy(tensor_input[position, :, Channel.insert])
-        for base_index in range(0, 4):
-            insertion_tensor[base_index] = insertion_tensor[base_index] + insertion_tensor[base_index + 4]
-            insertion_tensor[base_index + 4] = 0
-            insertion_tensor[base_index] -= (
-                tensor_input[position, base_index, Channel.SNP] + tensor_input[position, base_index + 4, Channel.SNP]
-            )
-
-        insertion_bases += num2base[np.argmax(insertion_tensor) % 4]
-    return insertion_bases
+    return insertion_bases_from_insertion_base_tensor(insertion_base_tensor_from(
+        tensor_input, flanking_base_number + 1, flanking_base_number + variant_length + 1
+    ))
 
 
 def maximum_variant_length_from(variant_length):
@@ -485,27 +607,24 @@ def maximum_variant_length_from(variant_length):
         return variant_length
 
 
-def insertion_bases_from(
-    tensor_input,
-    variant_length,
-    sam_file,
-    contig,
-    position,
-    is_using_pysam_for_all_indel_bases_output
-):
+def insertion_bases_from_pysam(tensor_input, variant_length, sam_file, contig, position):
     """
-        Return (insertion_bases, insertion bases length) tuple
+        Return (insertion_bases, insertion bases length) tuple, bases are all from pysam
     """
-    if is_using_pysam_for_all_indel_bases_output:
-        insertion_bases = insertion_bases_using_pysam_from(
-            sam_file=sam_file,
-            contig=contig,
-            position=position,
-            minimum_insertion_length=variant_length,
-            maximum_insertion_length=maximum_variant_length_from(variant_length)
-        )
-        return insertion_bases, len(insertion_bases)
+    insertion_bases = insertion_bases_using_pysam_from(
+        sam_file=sam_file,
+        contig=contig,
+        position=position,
+        minimum_insertion_length=variant_length,
+        maximum_insertion_length=maximum_variant_length_from(variant_length)
+    )
+    return insertion_bases, len(insertion_bases)
+
 
+def insertion_bases_from(tensor_input, variant_length, sam_file, contig, position):
+    """
+        Return (insertion_bases, insertion bases length) tuple
+    """
     need_inferred_variant_length = variant_length >= minimum_variant_length_that_need_infer
     if not need_inferred_variant_length:
         insertion_bases = insertion_bases_using_tensor(tensor_input, variant_length)
@@ -525,6 +644,29 @@ def insertion_bases_from(
         return insertion_bases, len(insertion_bases)
 
 
+def deletion_bases_from_pysam(
+    tensor_input,
+    variant_length,
+    sam_file,
+    fasta_file,
+    contig,
+    position,
+    reference_sequence
+):
+    """
+        Return (deletion_bases, deletion bases length) tuple, bases are all from pysam
+    """
+    deletion_bases = deletion_bases_using_pysam_from(
+        sam_file=sam_file,
+        fasta_file=fasta_file,
+        contig=contig,
+        position=position,
+        minimum_deletion_length=variant_length,
+        maximum_deletion_length=maximum_variant_length_from(variant_length)
+    )
+    return deletion_bases, len(deletion_bases)
+
+
 def deletion_bases_from(
     tensor_input,
     variant_length,
@@ -532,23 +674,11 @@ def deletion_bases_from(
     fasta_file,
     contig,
     position,
-    reference_sequence,
-    is_using_pysam_for_all_indel_bases_output
+    reference_sequence
 ):
     """
         Return (deletion_bases, deletion bases length) tuple
     """
-    if is_using_pysam_for_all_indel_bases_output:
-        deletion_bases = deletion_bases_using_pysam_from(
-            sam_file=sam_file,
-            fasta_file=fasta_file,
-            contig=contig,
-            position=position,
-            minimum_deletion_length=variant_length,
-            maximum_deletion_length=maximum_variant_length_from(variant_length)
-        )
-        return deletion_bases, len(deletion_bases)
-
     deletion_bases = ""
     need_inferred_variant_length = variant_length >= minimum_variant_length_that_need_infer
     if need_inferred_variant_length:
@@ -566,25 +696,63 @@ def deletion_bases_from(
     return deletion_bases, len(deletion_bases)
 
 
-def quality_score_from(
-    reference,
-    alternate,
-    genotype_string,
+@lru_cache(maxsize=4096)
+def gt21_and_genotype_from(reference, alternate, genotype_string):
+    """
+    Return (gt21, genotype) enum tuple, memoized as only a few distinct inputs show up in a VCF
+    """
+    # genotype_string is always "<digit>/<digit>"
+    genotype_1, genotype_2 = ord(genotype_string[0]) - 48, ord(genotype_string[2]) - 48
+
+    return (
+        gt21_enum_from(reference, alternate, genotype_1, genotype_2),
+        genotype_enum_for_task(genotype_enum_from(genotype_1, genotype_2))
+    )
+
+
+def batch_quality_scores_from(batch_gt21_probabilities, batch_genotype_probabilities):
+    """
+    Return quality scores of every (gt21, genotype) outcome of each candidate in the batch,
+    shape: (batch_size, gt21 size, genotype size)
+    """
+    p = (batch_gt21_probabilities[:, :, None] * batch_genotype_probabilities[:, None, :]).astype(np.float64)
+    tmp = np.maximum(PHRED_SCALE * (np.log((1.0 - p) + 1e-300) - np.log(p + 1e-300)) + 16, 0)
+    return np.round(tmp * tmp).astype(np.int64)
+
+
+def quality_score_from(reference, alternate, genotype_string, quality_scores):
+    """
+    Return quality score of the called outcome, quality_scores: one candidate of batch_quality_scores_from()
+    """
+    gt21, genotype = gt21_and_genotype_from(reference, alternate, genotype_string)
+    return int(quality_scores[gt21, genotype])
+
+
+def is_homo_Ref_dominant_from(
     gt21_probabilities,
     genotype_probabilities,
+    variant_length_probabilities_1,
+    variant_length_probabilities_2,
+    reference_base,
 ):
-    genotype_1, genotype_2 = int(genotype_string[0]), int(genotype_string[2])
-
-    gt21 = gt21_enum_from(reference, alternate, genotype_1, genotype_2)
-    genotype = genotype_enum_for_task(genotype_enum_from(genotype_1, genotype_2))
+    """
+    Return True if homo reference is surely the most probable outcome, without building the outcome tables.
 
-    p = gt21_probabilities[gt21] * genotype_probabilities[genotype]
-    tmp = max(
-        (-10 * log(e, 10)) * log(((1.0 - p) + 1e-300) / (p + 1e-300)) + 16,
-        0
+    Every variant outcome probability is a genotype probability (homo / hetero variant) times a gt21 probability
+    times variant length probabilities (<= 1), so it is bounded by max(genotype) * max(gt21).
+    """
+    variant_length_0_probability = (
+        variant_length_probabilities_1[VARIANT_LENGTH_0_INDEX] *
+        variant_length_probabilities_2[VARIANT_LENGTH_0_INDEX]
     )
-
-    return int(round(tmp * tmp))
+    homo_Ref_probability = (
+        variant_length_0_probability * genotype_probabilities[GENOTYPE_HOMO_REFERENCE] *
+        gt21_probabilities[HOMO_REFERENCE_GT21[reference_base]]
+    )
+    variant_probability_upper_bound = max(
+        genotype_probabilities[GENOTYPE_HOMO_VARIANT], genotype_probabilities[GENOTYPE_HETERO_VARIANT]
+    ) * np.max(gt21_probabilities)
+    return homo_Ref_probability >= variant_probability_upper_bound
 
 
 def possible_outcome_probabilites_from(
@@ -594,87 +762,62 @@ def possible_outcome_probabilites_from(
     variant_length_probabilities_2,
     reference_base,
 ):
-    homo_reference_probability = genotype_probabilities[Genotype.homo_reference]
-    homo_variant_probability = genotype_probabilities[Genotype.homo_variant]
-    hetero_variant_probability = genotype_probabilities[Genotype.hetero_variant]
+    homo_reference_probability = genotype_probabilities[GENOTYPE_HOMO_REFERENCE]
+    homo_variant_probability = genotype_probabilities[GENOTYPE_HOMO_VARIANT]
+    hetero_variant_probability = genotype_probabilities[GENOTYPE_HETERO_VARIANT]
     variant_length_0_probability = (
-        variant_length_probabilities_1[0 + VariantLength.index_offset] *
-        variant_length_probabilities_2[0 + VariantLength.index_offset]
+        variant_length_probabilities_1[VARIANT_LENGTH_0_INDEX] *
+        variant_length_probabilities_2[VARIANT_LENGTH_0_INDEX]
     )
 
-    reference_gt21 = gt21_enum_from_label(reference_base + reference_base)
+    reference_gt21 = HOMO_REFERENCE_GT21[reference_base]
     homo_Ref_probability = (
         variant_length_0_probability * homo_reference_probability * gt21_probabilities[reference_gt21]
     )
 
-    homo_SNP_probabilities = [(
-        variant_length_0_probability * homo_variant_probability * gt21_probabilities[gt21]
-    ) for gt21 in HOMO_SNP_GT21]
-    hetero_SNP_probabilities = [(
-        variant_length_0_probability * hetero_variant_probability * gt21_probabilities[gt21]
-    ) for gt21 in HETERO_SNP_GT21]
+    homo_SNP_probabilities = (
+        variant_length_0_probability * homo_variant_probability * np.take(gt21_probabilities, HOMO_SNP_GT21_INDICES)
+    ).tolist()
+    hetero_SNP_probabilities = (
+        variant_length_0_probability * hetero_variant_probability *
+        np.take(gt21_probabilities, HETERO_SNP_GT21_INDICES)
+    ).tolist()
+
+    indel_length_probabilities_1 = indel_length_probabilities_from(variant_length_probabilities_1)
+    indel_length_probabilities_2 = indel_length_probabilities_from(variant_length_probabilities_2)
+    length_probability_table = indel_length_probability_table_from(
+        indel_length_probabilities_1, indel_length_probabilities_2
+    )
+    hetero_indel_probabilities = hetero_indel_probabilities_from(
+        variant_length_probabilities_1, variant_length_probabilities_2,
+        indel_length_probabilities_1, indel_length_probabilities_2
+    )
 
     # Insertion
-    homo_Ins_lengths, homo_Ins_probabilities = zip(*homo_Ins_tuples_from(
-        variant_length_probabilities_1, variant_length_probabilities_2,
-        homo_variant_probability * gt21_probabilities[GT21_Type.InsIns]
-    ))
-    homo_Ins_lengths, homo_Ins_probabilities = list(homo_Ins_lengths), list(homo_Ins_probabilities)
-    hetero_InsIns_length_tuples, hetero_InsIns_probabilities = zip(*hetero_InsIns_tuples_from(
-        variant_length_probabilities_1, variant_length_probabilities_2,
-        hetero_variant_probability * gt21_probabilities[GT21_Type.InsIns]
-    ))
-    hetero_InsIns_length_tuples, hetero_InsIns_probabilities = (
-        list(hetero_InsIns_length_tuples), list(hetero_InsIns_probabilities)
+    homo_Ins_lengths, homo_Ins_probabilities = homo_Ins_tuples_from(
+        length_probability_table, homo_variant_probability * gt21_probabilities[GT21_Type.InsIns]
+    )
+    hetero_InsIns_length_tuples, hetero_InsIns_probabilities = hetero_InsIns_tuples_from(
+        length_probability_table, hetero_variant_probability * gt21_probabilities[GT21_Type.InsIns]
     )
-    hetero_ACGT_Ins_tuples = []
-    gt21_base_tuples = [(GT21_Type.AIns, "A"), (GT21_Type.CIns, "C"), (GT21_Type.GIns, "G"), (GT21_Type.TIns, "T")]
-    for length_tuples, p in hetero_Ins_tuples_from(variant_length_probabilities_1, variant_length_probabilities_2):
-        for gt21, hetero_base in gt21_base_tuples:
-            hetero_ACGT_Ins_tuples.append((
-                hetero_base,
-                length_tuples,
-                p * gt21_probabilities[gt21] * hetero_variant_probability
-            ))
-    hetero_ACGT_Ins_bases, hetero_ACGT_Ins_lengths, hetero_ACGT_Ins_probabilities = zip(*hetero_ACGT_Ins_tuples)
-    hetero_ACGT_Ins_bases, hetero_ACGT_Ins_lengths, hetero_ACGT_Ins_probabilities = (
-        list(hetero_ACGT_Ins_bases), list(hetero_ACGT_Ins_lengths), list(hetero_ACGT_Ins_probabilities)
+    hetero_ACGT_Ins_bases, hetero_ACGT_Ins_lengths, hetero_ACGT_Ins_probabilities = hetero_ACGT_indel_tuples_from(
+        hetero_indel_probabilities[INS], gt21_probabilities, HETERO_INS_GT21_INDICES, hetero_variant_probability
     )
 
     # Deletion
-    homo_Del_lengths, homo_Del_probabilities = zip(*homo_Del_tuples_from(
-        variant_length_probabilities_1, variant_length_probabilities_2,
-        homo_variant_probability * gt21_probabilities[GT21_Type.DelDel]
-    ))
-    homo_Del_lengths, homo_Del_probabilities = list(homo_Del_lengths), list(homo_Del_probabilities)
-    hetero_DelDel_length_tuples, hetero_DelDel_probabilities = zip(*hetero_DelDel_tuples_from(
-        variant_length_probabilities_1, variant_length_probabilities_2,
-        hetero_variant_probability * gt21_probabilities[GT21_Type.DelDel]
-    ))
-    hetero_DelDel_length_tuples, hetero_DelDel_probabilities = (
-        list(hetero_DelDel_length_tuples), list(hetero_DelDel_probabilities)
+    homo_Del_lengths, homo_Del_probabilities = homo_Del_tuples_from(
+        length_probability_table, homo_variant_probability * gt21_probabilities[GT21_Type.DelDel]
     )
-    hetero_ACGT_Del_tuples = []
-    gt21_base_tuples = [(GT21_Type.ADel, "A"), (GT21_Type.CDel, "C"), (GT21_Type.GDel, "G"), (GT21_Type.TDel, "T")]
-    for length_tuples, p in hetero_Del_tuples_from(variant_length_probabilities_1, variant_length_probabilities_2):
-        for gt21, hetero_base in gt21_base_tuples:
-            hetero_ACGT_Del_tuples.append((
-                hetero_base,
-                length_tuples,
-                p * gt21_probabilities[gt21] * hetero_variant_probability
-            ))
-    hetero_ACGT_Del_bases, hetero_ACGT_Del_lengths, hetero_ACGT_Del_probabilities = zip(*hetero_ACGT_Del_tuples)
-    hetero_ACGT_Del_bases, hetero_ACGT_Del_lengths, hetero_ACGT_Del_probabilities = (
-        list(hetero_ACGT_Del_bases), list(hetero_ACGT_Del_lengths), list(hetero_ACGT_Del_probabilities)
+    hetero_DelDel_length_tuples, hetero_DelDel_probabilities = hetero_DelDel_tuples_from(
+        length_probability_table, hetero_variant_probability * gt21_probabilities[GT21_Type.DelDel]
+    )
+    hetero_ACGT_Del_bases, hetero_ACGT_Del_lengths, hetero_ACGT_Del_probabilities = hetero_ACGT_indel_tuples_from(
+        hetero_indel_probabilities[DEL], gt21_probabilities, HETERO_DEL_GT21_INDICES, hetero_variant_probability
     )
 
     # InsDel
-    hetero_InsDel_length_tuples, hetero_InsDel_probabilities = zip(*hetero_InsDel_tuples_from(
-        variant_length_probabilities_1, variant_length_probabilities_2,
-        hetero_variant_probability * gt21_probabilities[GT21_Type.InsDel]
-    ))
-    hetero_InsDel_length_tuples, hetero_InsDel_probabilities = (
-        list(hetero_InsDel_length_tuples), list(hetero_InsDel_probabilities)
+    hetero_InsDel_length_tuples, hetero_InsDel_probabilities = hetero_InsDel_tuples_from(
+        length_probability_table, hetero_variant_probability * gt21_probabilities[GT21_Type.InsDel]
     )
 
     return (
@@ -691,6 +834,320 @@ def possible_outcome_probabilites_from(
     )
 
 
+def batch_reference_bases_from(batch_reference_sequence):
+    """
+    Return bytes of the center reference base of each candidate in the batch
+    """
+    return "".join(
+        [reference_sequence[flanking_base_number] for reference_sequence in batch_reference_sequence]
+    ).encode()
+
+
+def batch_is_basic_base_from(batch_reference_bases):
+    """
+    Return a boolean array marking candidates with an ACGT(U) center reference base, others output nothing
+    """
+    return np.frombuffer(batch_reference_bases.translate(BASIC_BASE_TRANSLATION_TABLE), dtype=np.bool_)
+
+
+def batch_is_reference_from(batch_reference_bases, batch_Y):
+    """
+    Return a boolean array marking candidates whose most probable outcome is homo reference,
+    same as the first iteration of output_from() but computed for the whole batch at once.
+    batch_reference_bases: bytes of the center reference base of each candidate
+    """
+    batch_gt21_probabilities, batch_genotype_probabilities, \
+        batch_variant_length_probabilities_1, batch_variant_length_probabilities_2 = [np.asarray(y) for y in batch_Y]
+    batch_size = len(batch_reference_bases)
+
+    homo_reference_probability = batch_genotype_probabilities[:, Genotype.homo_reference]
+    homo_variant_probability = batch_genotype_probabilities[:, Genotype.homo_variant]
+    hetero_variant_probability = batch_genotype_probabilities[:, Genotype.hetero_variant]
+    variant_length_0_probability = (
+        batch_variant_length_probabilities_1[:, 0 + VariantLength.index_offset] *
+        batch_variant_length_probabilities_2[:, 0 + VariantLength.index_offset]
+    )
+
+    reference_gt21 = np.frombuffer(
+        batch_reference_bases.translate(HOMO_REFERENCE_GT21_TRANSLATION_TABLE), dtype=np.uint8
+    )
+    homo_Ref_probability = (
+        variant_length_0_probability * homo_reference_probability *
+        batch_gt21_probabilities[np.arange(batch_size), reference_gt21]
+    )
+
+    indel_length_probabilities_1 = indel_length_probabilities_from(batch_variant_length_probabilities_1)
+    indel_length_probabilities_2 = indel_length_probabilities_from(batch_variant_length_probabilities_2)
+    length_probability_table = indel_length_probability_table_from(
+        indel_length_probabilities_1, indel_length_probabilities_2
+    )
+    hetero_indel_probabilities = hetero_indel_probabilities_from(
+        batch_variant_length_probabilities_1, batch_variant_length_probabilities_2,
+        indel_length_probabilities_1, indel_length_probabilities_2
+    )
+
+    homo_InsIns_extra_probability = homo_variant_probability * batch_gt21_probabilities[:, GT21_Type.InsIns]
+    hetero_InsIns_extra_probability = hetero_variant_probability * batch_gt21_probabilities[:, GT21_Type.InsIns]
+    homo_DelDel_extra_probability = homo_variant_probability * batch_gt21_probabilities[:, GT21_Type.DelDel]
+    hetero_DelDel_extra_probability = hetero_variant_probability * batch_gt21_probabilities[:, GT21_Type.DelDel]
+    hetero_InsDel_extra_probability = hetero_variant_probability * batch_gt21_probabilities[:, GT21_Type.InsDel]
+
+    maximum_variant_probability = np.max(np.stack((
+        (
+            (variant_length_0_probability * homo_variant_probability)[:, None] *
+            np.take(batch_gt21_probabilities, HOMO_SNP_GT21_INDICES, axis=1)
+        ).max(axis=1),
+        (
+            (variant_length_0_probability * hetero_variant_probability)[:, None] *
+            np.take(batch_gt21_probabilities, HETERO_SNP_GT21_INDICES, axis=1)
+        ).max(axis=1),
+        (
+            np.diagonal(length_probability_table[:, INS, INS], axis1=1, axis2=2) *
+            homo_InsIns_extra_probability[:, None]
+        ).max(axis=1),
+        (
+            length_probability_table[:, INS, INS] * hetero_InsIns_extra_probability[:, None, None]
+        ).max(axis=(1, 2)),
+        (
+            hetero_indel_probabilities[:, INS, None] *
+            np.take(batch_gt21_probabilities, HETERO_INS_GT21_INDICES, axis=1)[:, None, :] *
+            hetero_variant_probability[:, None, None]
+        ).max(axis=(1, 2)),
+        (
+            np.diagonal(length_probability_table[:, DEL, DEL], axis1=1, axis2=2) *
+            homo_DelDel_extra_probability[:, None]
+        ).max(axis=1),
+        (
+            length_probability_table[:, DEL, DEL][:, HETERO_DelDel_MASK] * hetero_DelDel_extra_probability[:, None]
+        ).max(axis=1),
+        (
+            hetero_indel_probabilities[:, DEL, None] *
+            np.take(batch_gt21_probabilities, HETERO_DEL_GT21_INDICES, axis=1)[:, None, :] *
+            hetero_variant_probability[:, None, None]
+        ).max(axis=(1, 2)),
+        (
+            np.maximum(length_probability_table[:, INS, DEL], length_probability_table[:, DEL, INS]) *
+            hetero_InsDel_extra_probability[:, None, None]
+        ).max(axis=(1, 2)),
+    )), axis=0)
+
+    return homo_Ref_probability >= maximum_variant_probability
+
+
+def homo_SNP_outcome_from(
+    maximum_probability, outcome_group, x, contig, position, reference_sequence, reference_base,
+    gt21_probabilities, output_utilities
+):
+    base1, base2 = homo_SNP_bases_from(gt21_probabilities)
+    return reference_base, base1 if base1 != reference_base else base2
+
+
+def hetero_SNP_outcome_from(
+    maximum_probability, outcome_group, x, contig, position, reference_sequence, reference_base,
+    gt21_probabilities, output_utilities
+):
+    base1, base2 = hetero_SNP_bases_from(gt21_probabilities)
+    is_multi = base1 != reference_base and base2 != reference_base
+    if is_multi:
+        return reference_base, f"{base1},{base2}"
+    return reference_base, base1 if base1 != reference_base else base2
+
+
+def homo_Ins_outcome_from(
+    maximum_probability, outcome_group, x, contig, position, reference_sequence, reference_base,
+    gt21_probabilities, output_utilities
+):
+    homo_Ins_probabilities, homo_Ins_lengths = outcome_group
+    idx = homo_Ins_probabilities.index(maximum_probability)
+    variant_length = homo_Ins_lengths[idx]
+    del homo_Ins_probabilities[idx]
+    del homo_Ins_lengths[idx]
+
+    insertion_bases, insertion_length = output_utilities.insertion_bases_using(
+        tensor_input=x, variant_length=variant_length, contig=contig, position=position
+    )
+    if insertion_length == 0:
+        return None, None
+    return reference_base, reference_base + insertion_bases
+
+
+def hetero_ACGT_Ins_outcome_from(
+    maximum_probability, outcome_group, x, contig, position, reference_sequence, reference_base,
+    gt21_probabilities, output_utilities
+):
+    hetero_ACGT_Ins_probabilities, hetero_ACGT_Ins_lengths, hetero_ACGT_Ins_bases = outcome_group
+    idx = hetero_ACGT_Ins_probabilities.index(maximum_probability)
+    variant_length = hetero_ACGT_Ins_lengths[idx]
+    hetero_Ins_base = hetero_ACGT_Ins_bases[idx]
+    del hetero_ACGT_Ins_probabilities[idx]
+    del hetero_ACGT_Ins_lengths[idx]
+    del hetero_ACGT_Ins_bases[idx]
+
+    insertion_bases, insertion_length = output_utilities.insertion_bases_using(
+        tensor_input=x, variant_length=variant_length, contig=contig, position=position
+    )
+    if insertion_length == 0:
+        return None, None
+    alternate_base = reference_base + insertion_bases
+
+    is_SNP_Ins_multi = hetero_Ins_base != reference_base
+    if is_SNP_Ins_multi:
+        alternate_base = f"{hetero_Ins_base},{alternate_base}"
+    return reference_base, alternate_base
+
+
+def hetero_InsIns_outcome_from(
+    maximum_probability, outcome_group, x, contig, position, reference_sequence, reference_base,
+    gt21_probabilities, output_utilities
+):
+    hetero_InsIns_probabilities, hetero_InsIns_length_tuples = outcome_group
+    idx = hetero_InsIns_probabilities.index(maximum_probability)
+    variant_length_1, variant_length_2 = hetero_InsIns_length_tuples[idx]
+    del hetero_InsIns_probabilities[idx]
+    del hetero_InsIns_length_tuples[idx]
+
+    insertion_bases, insertion_length = output_utilities.insertion_bases_using(
+        tensor_input=x, variant_length=variant_length_2, contig=contig, position=position
+    )
+    if insertion_length == 0:
+        return None, None
+
+    another_insertion_bases = (
+        output_utilities.insertion_bases_using_pysam_using(
+            contig=contig,
+            position=position,
+            minimum_insertion_length=variant_length_1,
+            maximum_insertion_length=maximum_variant_length_from(variant_length_1),
+            insertion_bases_to_ignore=insertion_bases
+        ) or
+        insertion_bases[0:variant_length_1]
+    )
+    alternate_base_1 = reference_base + another_insertion_bases
+    alternate_base_2 = reference_base + insertion_bases
+    if alternate_base_1 != alternate_base_2:
+        return reference_base, f"{alternate_base_1},{alternate_base_2}"
+    return None, None
+
+
+def homo_Del_outcome_from(
+    maximum_probability, outcome_group, x, contig, position, reference_sequence, reference_base,
+    gt21_probabilities, output_utilities
+):
+    homo_Del_probabilities, homo_Del_lengths = outcome_group
+    idx = homo_Del_probabilities.index(maximum_probability)
+    variant_length = homo_Del_lengths[idx]
+    del homo_Del_probabilities[idx]
+    del homo_Del_lengths[idx]
+
+    deletion_bases, deletion_length = output_utilities.deletion_bases_using(
+        tensor_input=x,
+        variant_length=variant_length,
+        contig=contig,
+        position=position,
+        reference_sequence=reference_sequence,
+    )
+    if deletion_length == 0:
+        return None, None
+    return reference_base + deletion_bases, reference_base
+
+
+def hetero_ACGT_Del_outcome_from(
+    maximum_probability, outcome_group, x, contig, position, reference_sequence, reference_base,
+    gt21_probabilities, output_utilities
+):
+    hetero_ACGT_Del_probabilities, hetero_ACGT_Del_lengths, hetero_ACGT_Del_bases = outcome_group
+    idx = hetero_ACGT_Del_probabilities.index(maximum_probability)
+    variant_length = hetero_ACGT_Del_lengths[idx]
+    hetero_Del_base = hetero_ACGT_Del_bases[idx]
+    del hetero_ACGT_Del_probabilities[idx]
+    del hetero_ACGT_Del_lengths[idx]
+    del hetero_ACGT_Del_bases[idx]
+
+    deletion_bases, deletion_length = output_utilities.deletion_bases_using(
+        tensor_input=x,
+        variant_length=variant_length,
+        contig=contig,
+        position=position,
+        reference_sequence=reference_sequence,
+    )
+    if deletion_length == 0:
+        return None, None
+
+    is_SNP_Del_multi = hetero_Del_base != reference_base
+    if is_SNP_Del_multi:
+        return reference_base + deletion_bases, f"{reference_base},{hetero_Del_base}{deletion_bases}"
+    return reference_base + deletion_bases, reference_base
+
+
+def hetero_DelDel_outcome_from(
+    maximum_probability, outcome_group, x, contig, position, reference_sequence, reference_base,
+    gt21_probabilities, output_utilities
+):
+    hetero_DelDel_probabilities, hetero_DelDel_length_tuples = outcome_group
+    idx = hetero_DelDel_probabilities.index(maximum_probability)
+    variant_length_1, variant_length_2 = hetero_DelDel_length_tuples[idx]
+    del hetero_DelDel_probabilities[idx]
+    del hetero_DelDel_length_tuples[idx]
+
+    deletion_bases, deletion_length = output_utilities.deletion_bases_using(
+        tensor_input=x,
+        variant_length=variant_length_2,
+        contig=contig,
+        position=position,
+        reference_sequence=reference_sequence,
+    )
+    if deletion_length == 0:
+        return None, None
+
+    # alternate bases are the reference base alone and the reference base + deletion bases left by the shorter
+    # deletion, both differ from each other and from the reference bases only if the shorter one leaves some bases
+    if len(deletion_bases) <= variant_length_1:
+        return None, None
+    return (
+        reference_base + deletion_bases,
+        f"{reference_base},{reference_base}{deletion_bases[variant_length_1:]}"
+    )
+
+
+def hetero_InsDel_outcome_from(
+    maximum_probability, outcome_group, x, contig, position, reference_sequence, reference_base,
+    gt21_probabilities, output_utilities
+):
+    hetero_InsDel_probabilities, hetero_InsDel_length_tuples = outcome_group
+    idx = hetero_InsDel_probabilities.index(maximum_probability)
+    variant_length_1, variant_length_2 = hetero_InsDel_length_tuples[idx]
+    del hetero_InsDel_probabilities[idx]
+    del hetero_InsDel_length_tuples[idx]
+
+    insertion_bases, insertion_length = output_utilities.insertion_bases_using(
+        tensor_input=x, variant_length=variant_length_2, contig=contig, position=position
+    )
+    deletion_bases, deletion_length = output_utilities.deletion_bases_using(
+        tensor_input=x,
+        variant_length=variant_length_1,
+        contig=contig,
+        position=position,
+        reference_sequence=reference_sequence,
+    )
+    if insertion_length == 0 or deletion_length == 0:
+        return None, None
+    return reference_base + deletion_bases, f"{reference_base},{reference_base}{insertion_bases}{deletion_bases}"
+
+
+# outcome function of each variant type, in the order of the variant type flags returned by output_from
+VARIANT_OUTCOME_FUNCTIONS = [
+    homo_SNP_outcome_from,
+    hetero_SNP_outcome_from,
+    homo_Ins_outcome_from,
+    hetero_ACGT_Ins_outcome_from,
+    hetero_InsIns_outcome_from,
+    homo_Del_outcome_from,
+    hetero_ACGT_Del_outcome_from,
+    hetero_DelDel_outcome_from,
+    hetero_InsDel_outcome_from,
+]
+
+
 def output_from(
     x,
     reference_sequence,
@@ -704,13 +1161,20 @@ def output_from(
     output_config,
     output_utilities,
 ):
-    insertion_bases_using, deletion_bases_using, insertion_bases_using_pysam_using = (
-        output_utilities.insertion_bases_using,
-        output_utilities.deletion_bases_using,
-        output_utilities.insertion_bases_using_pysam_using,
+    reference_base_ACGT = BASE2ACGT[reference_sequence[tensor_position_center]]
+    reference_outcome = (
+        (True, False, False, False, False, False, False, False, False, False),
+        (reference_base_ACGT, reference_base_ACGT)
     )
+    if is_homo_Ref_dominant_from(
+        gt21_probabilities,
+        genotype_probabilities,
+        variant_length_probabilities_1,
+        variant_length_probabilities_2,
+        reference_base=reference_base_ACGT,
+    ):
+        return reference_outcome
 
-    reference_base_ACGT = BASE2ACGT[reference_sequence[tensor_position_center]]
     (
         homo_Ref_probability,
         homo_SNP_probabilities,
@@ -730,227 +1194,52 @@ def output_from(
         reference_base=reference_base_ACGT,
     )
 
-    reference_base, alternate_base = None, None
-    while reference_base is None or alternate_base is None:
-        maximum_probability = max(
-            homo_Ref_probability,
-            max(homo_SNP_probabilities),
-            max(hetero_SNP_probabilities),
-            max(homo_Ins_probabilities) if len(homo_Ins_probabilities) else 0,
-            max(homo_Del_probabilities) if len(homo_Del_probabilities) else 0,
-            max(hetero_ACGT_Ins_probabilities) if len(hetero_ACGT_Ins_probabilities) else 0,
-            max(hetero_InsIns_probabilities) if len(hetero_InsIns_probabilities) else 0,
-            max(hetero_ACGT_Del_probabilities) if len(hetero_ACGT_Del_probabilities) else 0,
-            max(hetero_DelDel_probabilities) if len(hetero_DelDel_probabilities) else 0,
-            max(hetero_InsDel_probabilities) if len(hetero_InsDel_probabilities) else 0,
-        )
+    # probabilities come first in each group, groups follow the order of VARIANT_OUTCOME_FUNCTIONS
+    outcome_groups = (
+        (homo_SNP_probabilities,),
+        (hetero_SNP_probabilities,),
+        (homo_Ins_probabilities, homo_Ins_lengths),
+        (hetero_ACGT_Ins_probabilities, hetero_ACGT_Ins_lengths, hetero_ACGT_Ins_bases),
+        (hetero_InsIns_probabilities, hetero_InsIns_length_tuples),
+        (homo_Del_probabilities, homo_Del_lengths),
+        (hetero_ACGT_Del_probabilities, hetero_ACGT_Del_lengths, hetero_ACGT_Del_bases),
+        (hetero_DelDel_probabilities, hetero_DelDel_length_tuples),
+        (hetero_InsDel_probabilities, hetero_InsDel_length_tuples),
+    )
+    reference_base = reference_sequence[tensor_position_center]
+
+    reference_bases, alternate_bases = None, None
+    while reference_bases is None or alternate_bases is None:
+        maximum_probabilities = [
+            max(outcome_group[0]) if len(outcome_group[0]) else 0 for outcome_group in outcome_groups
+        ]
+        maximum_probability = max(homo_Ref_probability, max(maximum_probabilities))
 
         is_reference = maximum_probability == homo_Ref_probability
         if is_reference:
-            return (
-                (True, False, False, False, False, False, False, False, False, False),
-                (reference_base_ACGT, reference_base_ACGT)
-            )
-
-        is_homo_SNP = maximum_probability in homo_SNP_probabilities
-        is_hetero_SNP = maximum_probability in hetero_SNP_probabilities
-        is_homo_insertion = maximum_probability in homo_Ins_probabilities
-        is_hetero_ACGT_Ins = maximum_probability in hetero_ACGT_Ins_probabilities
-        is_hetero_InsIns = maximum_probability in hetero_InsIns_probabilities
-        is_homo_deletion = maximum_probability in homo_Del_probabilities
-        is_hetero_ACGT_Del = maximum_probability in hetero_ACGT_Del_probabilities
-        is_hetero_DelDel = maximum_probability in hetero_DelDel_probabilities
-        is_insertion_and_deletion = maximum_probability in hetero_InsDel_probabilities
-
-        if is_homo_SNP:
-            base1, base2 = homo_SNP_bases_from(gt21_probabilities)
-            reference_base = reference_sequence[tensor_position_center]
-            alternate_base = base1 if base1 != reference_base else base2
-
-        elif is_hetero_SNP:
-            base1, base2 = hetero_SNP_bases_from(gt21_probabilities)
-            reference_base = reference_sequence[tensor_position_center]
-            is_multi = base1 != reference_base and base2 != reference_base
-            if is_multi:
-                alternate_base = "{},{}".format(base1, base2)
-            else:
-                alternate_base = base1 if base1 != reference_base else base2
-
-        elif is_homo_insertion:
-            idx = homo_Ins_probabilities.index(maximum_probability)
-            variant_length = homo_Ins_lengths[idx]
-            del homo_Ins_probabilities[idx]
-            del homo_Ins_lengths[idx]
-
-            insertion_bases, insertion_length = insertion_bases_using(
-                tensor_input=x, variant_length=variant_length, contig=contig, position=position
-            )
-            if insertion_length == 0:
-                continue
-            reference_base = reference_sequence[tensor_position_center]
-            alternate_base = reference_base + insertion_bases
-
-        elif is_hetero_ACGT_Ins:
-            idx = hetero_ACGT_Ins_probabilities.index(maximum_probability)
-            variant_length = hetero_ACGT_Ins_lengths[idx]
-            hetero_Ins_base = hetero_ACGT_Ins_bases[idx]
-            del hetero_ACGT_Ins_probabilities[idx]
-            del hetero_ACGT_Ins_lengths[idx]
-            del hetero_ACGT_Ins_bases[idx]
-
-            insertion_bases, insertion_length = insertion_bases_using(
-                tensor_input=x, variant_length=variant_length, contig=contig, position=position
-            )
-            if insertion_length == 0:
-                continue
-            reference_base = reference_sequence[tensor_position_center]
-            alternate_base = reference_base + insertion_bases
-
-            is_SNP_Ins_multi = hetero_Ins_base != reference_base
-            if is_SNP_Ins_multi:
-                alternate_base = "{},{}".format(hetero_Ins_base, alternate_base)
-
-        elif is_hetero_InsIns:
-            idx = hetero_InsIns_probabilities.index(maximum_probability)
-            variant_length_1, variant_length_2 = hetero_InsIns_length_tuples[idx]
-            del hetero_InsIns_probabilities[idx]
-            del hetero_InsIns_length_tuples[idx]
-
-            insertion_bases, insertion_length = insertion_bases_using(
-                tensor_input=x, variant_length=variant_length_2, contig=contig, position=position
-            )
-            if insertion_length == 0:
-                continue
-            reference_base = reference_sequence[tensor_position_center]
-            alternate_base = reference_base + insertion_bases
-
-            another_insertion_bases = (
-                insertion_bases_using_pysam_using(
-                    contig=contig,
-                    position=position,
-                    minimum_insertion_length=variant_length_1,
-                    maximum_insertion_length=maximum_variant_length_from(variant_length_1),
-                    insertion_bases_to_ignore=insertion_bases
-                ) or
-                insertion_bases[0:variant_length_1]
-            )
-            alternate_base_1 = reference_base + another_insertion_bases
-            alternate_base_2 = alternate_base
-            if alternate_base_1 != alternate_base_2:
-                alternate_base = "{},{}".format(alternate_base_1, alternate_base_2)
-            else:
-                reference_base, alternate_base = None, None
-
-        elif is_homo_deletion:
-            idx = homo_Del_probabilities.index(maximum_probability)
-            variant_length = homo_Del_lengths[idx]
-            del homo_Del_probabilities[idx]
-            del homo_Del_lengths[idx]
-
-            deletion_bases, deletion_length = deletion_bases_using(
-                tensor_input=x,
-                variant_length=variant_length,
-                contig=contig,
-                position=position,
-                reference_sequence=reference_sequence,
-            )
-            if deletion_length == 0:
-                continue
-            reference_base = reference_sequence[tensor_position_center] + deletion_bases
-            alternate_base = reference_base[0]
-
-        elif is_hetero_ACGT_Del:
-            idx = hetero_ACGT_Del_probabilities.index(maximum_probability)
-            variant_length = hetero_ACGT_Del_lengths[idx]
-            hetero_Del_base = hetero_ACGT_Del_bases[idx]
-            del hetero_ACGT_Del_probabilities[idx]
-            del hetero_ACGT_Del_lengths[idx]
-            del hetero_ACGT_Del_bases[idx]
-
-            deletion_bases, deletion_length = deletion_bases_using(
-                tensor_input=x,
-                variant_length=variant_length,
-                contig=contig,
-                position=position,
-                reference_sequence=reference_sequence,
-            )
-            if deletion_length == 0:
-                continue
-            reference_base = reference_sequence[tensor_position_center] + deletion_bases
-            alternate_base = reference_base[0]
-
-            is_SNP_Del_multi = hetero_Del_base != reference_base[0]
-            if is_SNP_Del_multi:
-                alternate_base_1 = alternate_base
-                alternate_base_2 = hetero_Del_base + reference_base[1:]
-                alternate_base = "{},{}".format(alternate_base_1, alternate_base_2)
-
-        elif is_hetero_DelDel:
-            idx = hetero_DelDel_probabilities.index(maximum_probability)
-            variant_length_1, variant_length_2 = hetero_DelDel_length_tuples[idx]
-            del hetero_DelDel_probabilities[idx]
-            del hetero_DelDel_length_tuples[idx]
-
-            deletion_bases, deletion_length = deletion_bases_using(
-                tensor_input=x,
-                variant_length=variant_length_2,
-                contig=contig,
-                position=position,
-                reference_sequence=reference_sequence,
-            )
-            if deletion_length == 0:
-                continue
-            reference_base = reference_sequence[tensor_position_center] + deletion_bases
-            alternate_base = reference_base[0]
-
-            alternate_base_1 = alternate_base
-            alternate_base_2 = reference_base[0] + reference_base[variant_length_1 + 1:]
-            if (
-                alternate_base_1 != alternate_base_2 and
-                reference_base != alternate_base_1 and reference_base != alternate_base_2
-            ):
-                alternate_base = "{},{}".format(alternate_base_1, alternate_base_2)
-            else:
-                reference_base, alternate_base = None, None
-
-        elif is_insertion_and_deletion:
-            idx = hetero_InsDel_probabilities.index(maximum_probability)
-            variant_length_1, variant_length_2 = hetero_InsDel_length_tuples[idx]
-            del hetero_InsDel_probabilities[idx]
-            del hetero_InsDel_length_tuples[idx]
-
-            insertion_bases, insertion_length = insertion_bases_using(
-                tensor_input=x, variant_length=variant_length_2, contig=contig, position=position
-            )
-            deletion_bases, deletion_length = deletion_bases_using(
-                tensor_input=x,
-                variant_length=variant_length_1,
-                contig=contig,
-                position=position,
-                reference_sequence=reference_sequence,
-            )
-            if insertion_length == 0 or deletion_length == 0:
-                continue
-            reference_base = reference_sequence[tensor_position_center] + deletion_bases
-            alternate_base = "{},{}".format(
-                reference_base[0],
-                reference_base[0] + insertion_bases + reference_base[1:]
-            )
+            return reference_outcome
+
+        # maximum_probability is in a group iff it is the maximum of that group
+        is_variant_types = [probability == maximum_probability for probability in maximum_probabilities]
+        variant_type = is_variant_types.index(True)
+        reference_bases, alternate_bases = VARIANT_OUTCOME_FUNCTIONS[variant_type](
+            maximum_probability,
+            outcome_groups[variant_type],
+            x,
+            contig,
+            position,
+            reference_sequence,
+            reference_base,
+            gt21_probabilities,
+            output_utilities,
+        )
 
-    return (
-        (
-            is_reference, is_homo_SNP, is_hetero_SNP,
-            is_homo_insertion, is_hetero_ACGT_Ins, is_hetero_InsIns,
-            is_homo_deletion, is_hetero_ACGT_Del, is_hetero_DelDel,
-            is_insertion_and_deletion
-        ),
-        (reference_base, alternate_base)
-    )
+    return (False,) + tuple(is_variant_types), (reference_bases, alternate_bases)
 
 
 def batch_output_for_ensemble(mini_batch, batch_Y, output_config, output_utilities):
-    X, batch_chr_pos_seq = mini_batch
-    batch_size = len(batch_chr_pos_seq)
+    X, (batch_chromosome, batch_position, batch_reference_sequence) = mini_batch
+    batch_size = len(batch_reference_sequence)
 
     batch_gt21_probabilities, batch_genotype_probabilities, \
         batch_variant_length_probabilities_1, batch_variant_length_probabilities_2 = batch_Y
@@ -961,48 +1250,65 @@ def batch_output_for_ensemble(mini_batch, batch_Y, output_config, output_utiliti
             (batch_size, len(batch_gt21_probabilities))
         )
 
-    tensor_position_center = flanking_base_number
+    row_indices = np.flatnonzero(batch_is_basic_base_from(batch_reference_bases_from(batch_reference_sequence)))
 
-    for (
-        x,
-        chr_pos_seq,
-        gt21_probabilities,
-        genotype_probabilities,
-        variant_length_probabilities_1,
-        variant_length_probabilities_2
-    ) in zip(
-        X,
-        batch_chr_pos_seq,
+    # convert the whole batch to python values once, rows are then accessed by index
+    batch_tensor = X.reshape(batch_size, -1).astype(int).tolist()
+    batch_probabilities = np.concatenate([
         batch_gt21_probabilities,
         batch_genotype_probabilities,
         batch_variant_length_probabilities_1,
-        batch_variant_length_probabilities_2
-    ):
-        chromosome, position, reference_sequence = chr_pos_seq
+        batch_variant_length_probabilities_2,
+    ], axis=1).tolist()
+    batch_position = batch_position.tolist()
+
+    def output_rows_with(row_indices):
+        for row_index in row_indices:
+            output_utilities.output(
+                "\t".join(
+                    [
+                        batch_chromosome[row_index],
+                        str(batch_position[row_index]),
+                        batch_reference_sequence[row_index],
+                    ] +
+                    [str(value) for value in batch_tensor[row_index]] +
+                    ["{:0.6f}".format(p) for p in batch_probabilities[row_index]]
+                )
+            )
 
-        if reference_sequence[tensor_position_center] not in BASIC_BASES:
-            continue
+    # formatting is bound by the interpreter, buffer the whole batch in one task and write it once
+    output_utilities.output_in_parallel(output_rows_with, [row_indices.tolist()])
 
-        tensor = x.flatten().astype(int).astype(str)
 
-        output_utilities.output(
-            "\t".join(
-                [
-                    chromosome,
-                    position,
-                    reference_sequence,
-                ] +
-                list(tensor) +
-                ["{:0.6f}".format(p) for p in list(gt21_probabilities)] +
-                ["{:0.6f}".format(p) for p in list(genotype_probabilities)] +
-                ["{:0.6f}".format(p) for p in list(variant_length_probabilities_1)] +
-                ["{:0.6f}".format(p) for p in list(variant_length_probabilities_2)]
-            )
-        )
+def batch_read_counts_from(X):
+    """
+    Return (read_depth, reference_reads, base_supported_reads, insertion_reads, deletion_reads) of each tensor
+    in the batch, all in python values, every tensor position is read from X once
+        read_depth: delete + reference reads at the center
+        reference_reads: reference reads of each ACGT base at the center, both strands summed up
+        base_supported_reads: SNP + reference reads of each ACGT base at the center, both strands summed up
+        insertion_reads: insert - SNP reads at the position after the center, all bases and strands summed up
+        deletion_reads: delete reads at the position after the center, all bases and strands summed up
+    """
+    # (batch, channel, ACGT) with both strands summed up
+    center = X[:, flanking_base_number, :4, :] + X[:, flanking_base_number, 4:, :]
+    center = np.ascontiguousarray(center.transpose(0, 2, 1))
+    read_depths = (center[:, Channel.delete].sum(axis=1) + center[:, Channel.reference].sum(axis=1)).tolist()
+    reference_reads = center[:, Channel.reference]
+    base_supported_reads = (center[:, Channel.SNP] + reference_reads).tolist()
+    channel_sums = X[:, flanking_base_number + 1].sum(axis=1)
+    insertion_reads = (channel_sums[:, Channel.insert] - channel_sums[:, Channel.SNP]).tolist()
+    deletion_reads = channel_sums[:, Channel.delete].tolist()
+    return list(zip(read_depths, reference_reads.tolist(), base_supported_reads, insertion_reads, deletion_reads))
+
 
 def output_with(
     x,
-    chr_pos_seq,
+    read_counts,
+    quality_scores,
+    chromosome,
+    position,
+    reference_sequence,
     gt21_probabilities,
     genotype_probabilities,
     variant_length_probabilities_1,
@@ -1010,19 +1316,12 @@ def output_with(
     output_config,
     output_utilities
 ):
-    chromosome, position, reference_sequence = chr_pos_seq
-    position = int(position)
-
+    # candidates with a non ACGT(U) reference base are filtered out by the callers
     tensor_position_center = flanking_base_number
     information_string = "."
 
-    if reference_sequence[tensor_position_center] not in BASIC_BASES:
-        return
-
     # read depth
-    read_depth = sum(
-        x[tensor_position_center, :, Channel.delete] + x[tensor_position_center, :, Channel.reference]
-    )
+    read_depth, reference_reads, base_supported_reads, insertion_reads, deletion_reads = read_counts
     if read_depth == 0:
         output_utilities.print_debug_message(
             chromosome,
@@ -1085,82 +1384,47 @@ def output_with(
         return
 
     # geno type string
-    if is_reference:
-        genotype_string = genotype_string_from(Genotype.homo_reference)
+    # multi alleles override the genotype of the variant type, decide it first so it is assigned only once
+    if is_multi:
+        genotype_string = HETERO_VARIANT_MULTI_GENOTYPE_STRING
+    elif is_reference:
+        genotype_string = HOMO_REFERENCE_GENOTYPE_STRING
     elif is_homo_SNP or is_homo_insertion or is_homo_deletion:
-        genotype_string = genotype_string_from(Genotype.homo_variant)
+        genotype_string = HOMO_VARIANT_GENOTYPE_STRING
     elif is_hetero_SNP or is_hetero_ACGT_Ins or is_hetero_InsIns or is_hetero_ACGT_Del or is_hetero_DelDel:
-        genotype_string = genotype_string_from(Genotype.hetero_variant)
-    if is_multi:
-        genotype_string = genotype_string_from(Genotype.hetero_variant_multi)
+        genotype_string = HETERO_VARIANT_GENOTYPE_STRING
 
     # allele frequency / supported reads
     supported_reads_count = 0
     if is_reference:
-        supported_reads_count = (
-            x[tensor_position_center, BASE2NUM[reference_base], Channel.reference] +
-            x[tensor_position_center, BASE2NUM[reference_base]+4, Channel.reference]
-        )
+        supported_reads_count = reference_reads[BASE2NUM[reference_base]]
     elif is_homo_SNP or is_hetero_SNP:
-        for base in str(alternate_base):
+        for base in alternate_base:
             if base == ',':
                 continue
-            supported_reads_count += (
-                x[tensor_position_center, BASE2NUM[base], Channel.SNP] +
-                x[tensor_position_center, BASE2NUM[base]+4, Channel.SNP] +
-                x[tensor_position_center, BASE2NUM[base], Channel.reference] +
-                x[tensor_position_center, BASE2NUM[base]+4, Channel.reference]
-            )
+            supported_reads_count += base_supported_reads[BASE2NUM[base]]
     elif is_homo_insertion or is_hetero_InsIns:
-        supported_reads_count = (
-            sum(x[tensor_position_center+1, :, Channel.insert]) -
-            sum(x[tensor_position_center+1, :, Channel.SNP])
-        )
+        supported_reads_count = insertion_reads
     elif is_hetero_ACGT_Ins:
-        is_SNP_Ins_multi = is_multi
-        SNP_base = alternate_base.split(",")[0][0] if is_SNP_Ins_multi else None
-        supported_reads_for_SNP = (
-            x[tensor_position_center, BASE2NUM[SNP_base], Channel.SNP] +
-            x[tensor_position_center, BASE2NUM[SNP_base]+4, Channel.SNP] +
-            x[tensor_position_center, BASE2NUM[SNP_base], Channel.reference] +
-            x[tensor_position_center, BASE2NUM[SNP_base]+4, Channel.reference]
-        ) if is_SNP_Ins_multi else 0
-
-        supported_reads_count = (
-            sum(x[tensor_position_center+1, :, Channel.insert]) -
-            sum(x[tensor_position_center+1, :, Channel.SNP])
-        ) + supported_reads_for_SNP
+        supported_reads_count = insertion_reads
+        if is_multi:
+            SNP_base = alternate_base.split(",")[0][0]
+            supported_reads_count += base_supported_reads[BASE2NUM[SNP_base]]
     elif is_homo_deletion or is_hetero_DelDel:
-        supported_reads_count = sum(x[tensor_position_center+1, :, Channel.delete])
+        supported_reads_count = deletion_reads
     elif is_hetero_ACGT_Del:
-        is_SNP_Del_multi = is_multi
-        SNP_base = alternate_base.split(",")[1][0] if is_SNP_Del_multi else None
-        supported_reads_for_SNP = (
-            x[tensor_position_center, BASE2NUM[SNP_base], Channel.SNP] +
-            x[tensor_position_center, BASE2NUM[SNP_base]+4, Channel.SNP] +
-            x[tensor_position_center, BASE2NUM[SNP_base], Channel.reference] +
-            x[tensor_position_center, BASE2NUM[SNP_base]+4, Channel.reference]
-        ) if is_SNP_Del_multi else 0
-
-        supported_reads_count = sum(x[tensor_position_center+1, :, Channel.delete]) + supported_reads_for_SNP
+        supported_reads_count = deletion_reads
+        if is_multi:
+            SNP_base = alternate_base.split(",")[1][0]
+            supported_reads_count += base_supported_reads[BASE2NUM[SNP_base]]
     elif is_insertion_and_deletion:
-        supported_reads_count = (
-            sum(x[tensor_position_center+1, :, Channel.insert]) +
-            sum(x[tensor_position_center+1, :, Channel.delete]) -
-            sum(x[tensor_position_center+1, :, Channel.SNP])
-        )
-    allele_frequency = ((supported_reads_count + 0.0) / read_depth) if read_depth != 0 else 0.0
+        supported_reads_count = insertion_reads + deletion_reads
+    allele_frequency = (supported_reads_count / read_depth) if read_depth != 0 else 0.0
     if allele_frequency > 1:
         allele_frequency = 1
 
     # quality score
-    quality_score = quality_score_from(
-        reference_base,
-        alternate_base,
-        genotype_string,
-        gt21_probabilities,
-        genotype_probabilities,
-    )
+    quality_score = quality_score_from(reference_base, alternate_base, genotype_string, quality_scores)
 
     # replace genotype string if any haploid mode enabled
     if output_config.is_haploid_precision_mode_enabled or output_config.is_haploid_sensitive_mode_enabled:
@@ -1182,24 +1446,15 @@ def output_with(
             "Normal output" if not is_reference else "Reference"
         )
     else:
-        output_utilities.output("%s\t%d\t.\t%s\t%s\t%d\t%s\t%s\tGT:GQ:DP:AF\t%s:%d:%d:%.4f" % (
-            chromosome,
-            position,
-            reference_base,
-            alternate_base,
-            quality_score,
-            filtration_value,
-            information_string,
-            genotype_string,
-            quality_score,
-            read_depth,
-            allele_frequency
-        ))
+        output_utilities.output(
+            f"{chromosome}\t{position}\t.\t{reference_base}\t{alternate_base}\t{quality_score}\t{filtration_value}\t"
+            f"{information_string}\tGT:GQ:DP:AF\t{genotype_string}:{quality_score}:{read_depth}:{allele_frequency:.4f}"
+        )
 
 
 def batch_output(mini_batch, batch_Y, output_config, output_utilities):
-    X, batch_chr_pos_seq = mini_batch
-    batch_size = len(batch_chr_pos_seq)
+    X, (batch_chromosome, batch_position, batch_reference_sequence) = mini_batch
+    batch_size = len(batch_reference_sequence)
 
     batch_gt21_probabilities, batch_genotype_probabilities, \
         batch_variant_length_probabilities_1, batch_variant_length_probabilities_2 = batch_Y
@@ -1210,31 +1465,57 @@ def batch_output(mini_batch, batch_Y, output_config, output_utilities):
             (batch_size, len(batch_gt21_probabilities))
         )
     before_batch_output_time = time()
-    for (
-        x,
-        chr_pos_seq,
-        gt21_probabilities,
-        genotype_probabilities,
-        variant_length_probabilities_1,
-        variant_length_probabilities_2
-    ) in zip(
-        X,
-        batch_chr_pos_seq,
-        batch_gt21_probabilities,
-        batch_genotype_probabilities,
-        batch_variant_length_probabilities_1,
-        batch_variant_length_probabilities_2
-    ):
-        output_with(
-            x,
-            chr_pos_seq,
-            gt21_probabilities,
-            genotype_probabilities,
-            variant_length_probabilities_1,
-            variant_length_probabilities_2,
-            output_config,
-            output_utilities,
+
+    batch_reference_bases = batch_reference_bases_from(batch_reference_sequence)
+    is_row_needed = batch_is_basic_base_from(batch_reference_bases)
+
+    # rows with zero read depth output nothing but the debug message, skip them before any per-row work
+    if not output_config.is_debug:
+        center = X[:, flanking_base_number]
+        is_row_needed = is_row_needed & (
+            center[:, :, Channel.delete].sum(axis=1) + center[:, :, Channel.reference].sum(axis=1) != 0
         )
+
+    # reference calls output nothing unless showing reference or debugging, skip them for the whole batch
+    is_all_rows_needed = output_config.is_show_reference or output_config.is_debug
+    if not is_all_rows_needed:
+        is_row_needed = is_row_needed & ~batch_is_reference_from(batch_reference_bases, batch_Y)
+    row_indices = np.flatnonzero(is_row_needed)
+
+    # python int for pysam
+    batch_position = batch_position.tolist()
+
+    # gather only the rows to output, so read counts are summed up for them alone,
+    # as integers for the DP field and the exact read counting of output_from()
+    batch_tensor = X[row_indices].astype(np.int32)
+    batch_read_counts = batch_read_counts_from(batch_tensor)
+    batch_quality_scores = batch_quality_scores_from(
+        np.asarray(batch_gt21_probabilities)[row_indices], np.asarray(batch_genotype_probabilities)[row_indices]
+    )
+    row_indices = row_indices.tolist()
+
+    def output_rows_with(tensor_indices_of_a_chunk):
+        for tensor_index in tensor_indices_of_a_chunk:
+            row_index = row_indices[tensor_index]
+            output_with(
+                batch_tensor[tensor_index],
+                batch_read_counts[tensor_index],
+                batch_quality_scores[tensor_index],
+                batch_chromosome[row_index],
+                batch_position[row_index],
+                batch_reference_sequence[row_index],
+                batch_gt21_probabilities[row_index],
+                batch_genotype_probabilities[row_index],
+                batch_variant_length_probabilities_1[row_index],
+                batch_variant_length_probabilities_2[row_index],
+                output_config,
+                output_utilities,
+            )
+
+    # rows are independent, split them into contiguous chunks so the output order is kept
+    output_utilities.output_in_parallel(
+        output_rows_with, np.array_split(np.arange(len(row_indices)), param.NUM_THREADS)
+    )
     print("Function batch_output_takes {:.4} s".format(time() - before_batch_output_time))
 
 
@@ -1254,17 +1535,19 @@ def log_activation(args, m):
     while num_plotted < args.max_plot or args.max_plot < 0:
         print("Getting next batch")
         try:
-            batch_X, batch_chr_pos_seq = next(tensor_generator)
+            batch_X, (batch_chromosome, batch_position, _) = next(tensor_generator)
         except StopIteration:
             break
-        batch_size = len(batch_chr_pos_seq)
+        batch_size = len(batch_chromosome)
         print("Batch generation complete %d" % batch_size)
         # strip away the reference string, keeping the chr and coor only
-        batch_chr_pos_seq = [chr+":"+pos for chr, pos, _ in batch_chr_pos_seq]
+        batch_chr_pos = [
+            "%s:%d" % (chromosome, position) for chromosome, position in zip(batch_chromosome, batch_position)
+        ]
         summaries = m.get_activation_summary(
             batch_X,
             operations=m.layers,
-            batch_item_suffixes=batch_chr_pos_seq,
+            batch_item_suffixes=batch_chr_pos,
             max_plot_in_batch=args.max_plot - num_plotted if args.max_plot >= 0 else batch_size,
             parallel_level=args.parallel_level,
             num_workers=args.workers,
@@ -1290,7 +1573,12 @@ def call_variants_with_probabilities_input(args, output_config, output_utilities
         chromosome = columns[0]
         position = columns[1]
         sequence = columns[2]
+        # same as rows of a batch, nothing is output for a non ACGT(U) reference base
+        if sequence[flanking_base_number] not in BASIC_BASES:
+            continue
         x = np.reshape(np.array(columns[3:3 + no_of_tensor_values], dtype=np.float32), tensor_dimensions)
+        # same int32 read counts as tensors of a batch
+        x = x.astype(np.int32)
         probabilities = np.array(columns[3+no_of_tensor_values:], dtype=np.float32)
         gt21_probabilities = probabilities[0:21]
         genotype_probabilities = probabilities[21:21+3]
@@ -1299,7 +1587,11 @@ def call_variants_with_probabilities_input(args, output_config, output_utilities
 
         output_with(
             x,
-            (chromosome, position, sequence),
+            batch_read_counts_from(x[np.newaxis])[0],
+            batch_quality_scores_from(gt21_probabilities[np.newaxis], genotype_probabilities[np.newaxis])[0],
+            chromosome,
+            int(position),
+            sequence,
             gt21_probabilities,
             genotype_probabilities,
             variant_length_1_probabilities,
@@ -1375,11 +1667,69 @@ def call_variants(args, m, output_config, output_utilities):
 
 
     else:
-        while True:
-
-            thread_pool = []
+        if args.pipe_line:
+            # long-lived loading and output threads, prediction stays on the calling thread,
+            # bounded queues keep at most a few mini batches in flight between the stages
+            mini_batches_to_predict_queue = Queue(maxsize=2)
+            mini_batches_to_output_queue = Queue(maxsize=2)
+
+            # the first exception of any stage is kept and re-raised after the threads are joined,
+            # the other stages keep draining their queues until the None sentinel so that no one blocks on a put()
+            pipeline_exceptions = []
+
+            def load_mini_batches():
+                try:
+                    for mini_batch in tensor_generator:
+                        if pipeline_exceptions:
+                            break
+                        mini_batches_to_predict_queue.put(mini_batch)
+                except BaseException as e:
+                    pipeline_exceptions.append(e)
+                finally:
+                    mini_batches_to_predict_queue.put(None)
+
+            def output_mini_batches():
+                while True:
+                    mini_batch_with_prediction = mini_batches_to_output_queue.get()
+                    if mini_batch_with_prediction is None:
+                        return
+                    if pipeline_exceptions:
+                        continue
+                    mini_batch, prediction = mini_batch_with_prediction
+                    try:
+                        batch_output_method(mini_batch, prediction, output_config, output_utilities)
+                    except BaseException as e:
+                        pipeline_exceptions.append(e)
+
+            loading_thread = Thread(target=load_mini_batches)
+            output_thread = Thread(target=output_mini_batches)
+            loading_thread.start()
+            output_thread.start()
+
+            try:
+                while True:
+                    mini_batch = mini_batches_to_predict_queue.get()
+                    if mini_batch is None:
+                        break
+                    if pipeline_exceptions:
+                        continue
+                    try:
+                        X, _ = mini_batch
+                        prediction = m.predict(batchX=X)
+                        mini_batch_prediction_output.append(prediction)
+                        mini_batches_to_output_queue.put((mini_batch, prediction))
+                    except BaseException as e:
+                        pipeline_exceptions.append(e)
+            finally:
+                mini_batches_to_output_queue.put(None)
+
+            loading_thread.join()
+            output_thread.join()
+            if pipeline_exceptions:
+                raise pipeline_exceptions[0]
 
-            if not args.pipe_line:
+        else:
+            while True:
                 if len(mini_batches_to_output) > 0:
                     mini_batch = mini_batches_to_output.pop(0)
                     batch_output_time = time()
@@ -1399,40 +1749,17 @@ def call_variants(args, m, output_config, output_utilities):
                     load_mini_batch()
                     print("Load mini bach costs %.4f" % round(time() - load_mini_batch_time, 4))
                     time_counter["Load_mini_batch"].append(round(time() - load_mini_batch_time, 4))
-            else:
-                if len(mini_batches_to_output) > 0:
-                    mini_batch = mini_batches_to_output.pop(0)
-                    mini_batch_prediction_output.append(m.prediction)
-                    thread_pool.append(Thread(
-                        target=batch_output_method, args=(mini_batch, m.prediction, output_config, output_utilities)
-                    ))
 
-                if len(mini_batches_to_predict) > 0:
-                    mini_batch = mini_batches_to_predict.pop(0)
-                    # mini_batch_prediction_input.append(mini_batch)
-                    X, _ = mini_batch
-                    thread_pool.append(Thread(target=m.predict, kwargs={"batchX":X}))
-                    mini_batches_to_output.append(mini_batch)
-
-
-                if not is_finish_loaded_all_mini_batches:
-                    thread_pool.append(Thread(target=load_mini_batch))
-
-                for t in thread_pool:
-                    t.start()
-                for t in thread_pool:
-                    t.join()
-
-            is_finish_loaded_all_mini_batches = len(mini_batches_loaded) == 0
-            while len(mini_batches_loaded) > 0:
-                mini_batch = mini_batches_loaded.pop(0)
-                mini_batches_to_predict.append(mini_batch)
+                is_finish_loaded_all_mini_batches = len(mini_batches_loaded) == 0
+                while len(mini_batches_loaded) > 0:
+                    mini_batch = mini_batches_loaded.pop(0)
+                    mini_batches_to_predict.append(mini_batch)
 
-            is_nothing_to_predict_and_output = (
-                len(thread_pool) <= 0 and len(mini_batches_to_predict) <= 0 and len(mini_batches_to_output) <= 0
-            )
-            if is_finish_loaded_all_mini_batches and is_nothing_to_predict_and_output:
-                break
+                is_nothing_to_predict_and_output = (
+                    len(mini_batches_to_predict) <= 0 and len(mini_batches_to_output) <= 0
+                )
+                if is_finish_loaded_all_mini_batches and is_nothing_to_predict_and_output:
+                    break
 
         logging.info("Total time elapsed: %.2f s" % (time() - variant_call_start_time))
         if args.store_loaded_mini_match:
@@ -110,6 +110,14 @@ def gt21_enum_from(reference, alternate, genotype_1, genotype_2, alternate_arr=N
 
 HOMO_SNP_GT21 = [GT21_Type.AA, GT21_Type.CC, GT21_Type.GG, GT21_Type.TT]
 HOMO_SNP_LABELS = [gt21_label_from(gt21_enum) for gt21_enum in HOMO_SNP_GT21]
+HOMO_SNP_BASE_TUPLES = [(label[0], label[1]) for label in HOMO_SNP_LABELS]
 
 HETERO_SNP_GT21 = [GT21_Type.AC, GT21_Type.AG, GT21_Type.AT, GT21_Type.CG, GT21_Type.CT, GT21_Type.GT]
 HETERO_SNP_LABELS = [gt21_label_from(gt21_enum) for gt21_enum in HETERO_SNP_GT21]
+HETERO_SNP_BASE_TUPLES = [(label[0], label[1]) for label in HETERO_SNP_LABELS]
+
+# homo reference gt21 of each reference base, e.g. "A" -> GT21_Type.AA
+HOMO_REFERENCE_GT21 = dict((base, gt21_enum_from_label(base + base)) for base in "ACGT")
+
+HETERO_INS_GT21 = [GT21_Type.AIns, GT21_Type.CIns, GT21_Type.GIns, GT21_Type.TIns]
+HETERO_DEL_GT21 = [GT21_Type.ADel, GT21_Type.CDel, GT21_Type.GDel, GT21_Type.TDel]
@@ -1,5 +1,3 @@
-from __future__ import print_function
-
 import sys
 import gc
 from time import time
@@ -89,15 +87,17 @@ def tensor_generator_from(tensor_file_path, batch_size):
     for batch in batches_from(fo, item_from=item_from, batch_size=batch_size):
         # tmp_time = time()
         tensors = np.empty((batch_size, input_tensor_size), dtype=np.float32)
-        non_tensor_infos = []
+        batch_chromosome, batch_position, batch_reference_sequence = [], [], []
         for non_tensor_info, tensor in batch:
-            _, _, sequence = non_tensor_info
+            chromosome, position, sequence = non_tensor_info
             if sequence[param.flankingBaseNum] not in BASE2NUM:
                 continue
-            tensors[len(non_tensor_infos)] = tensor
-            non_tensor_infos.append(non_tensor_info)
+            tensors[len(batch_reference_sequence)] = tensor
+            batch_chromosome.append(chromosome)
+            batch_position.append(position)
+            batch_reference_sequence.append(sequence)
 
-        current_batch_size = len(non_tensor_infos)
+        current_batch_size = len(batch_reference_sequence)
         X = np.reshape(tensors, (batch_size, no_of_positions, matrix_row, matrix_num))
         for i in range(1, matrix_num):
             X[:current_batch_size, :, :, i] -= X[:current_batch_size, :, :, 0]
@@ -107,7 +107,9 @@ def tensor_generator_from(tensor_file_path, batch_size):
         print("Processed %d tensors" % processed_tensors, file=sys.stderr)
         if current_batch_size <= 0:
             continue
-        yield X[:current_batch_size], non_tensor_infos[:current_batch_size]
+        yield X[:current_batch_size], (
+            batch_chromosome, np.array(batch_position, dtype=np.int64), batch_reference_sequence
+        )
 
 
     if tensor_file_path != "PIPE":